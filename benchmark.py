@@ -0,0 +1,206 @@
+# Benchmark Suite for the Simulation and Optimisation Hot Paths
+
+# Capabilities:
+# - Times Heat_system.Q_load, tank_temperature_ode, solve_tank_temperature (every solver and compute backend),
+#   run_heat_system_simulation, simulate_population, Optimisation.objective_function and a short fixed-seed differential evolution run.
+# - Reports RHS evaluation counts and peak memory (tracemalloc) per benchmark.
+# - Uses deterministic synthetic weather and COP fixtures, so it runs offline without the YAML file.
+# - Saves machine-readable JSON results and compares them against a stored baseline.
+
+# Limitations:
+# - Timings depend on the machine; compare results produced on the same machine only.
+
+# Usage:
+#   python benchmark.py --save baseline.json
+#   python benchmark.py --compare baseline.json --tolerance 1.25
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+import numpy as np
+import scipy
+
+import heat_system
+import kernels
+import weather_store
+from cop_model import COPModel
+from heat_system import Heat_system, run_heat_system_simulation
+
+# deterministic fixtures
+synthetic_cop_model = COPModel(coefficients=(1.95, 75.0), cache_path=None)  # close to the fit of the example YAML data
+house_D = (132, 0.51, 120, 0.18)  # Aw, Uw, Ar, Ur of house D
+T_sp, U_cond, T_cond, U_tank, A_tank, c_t, A_cond = 293.15, 300, 343.15, 5, 1, 837200, 1.11
+initial_tank_temp = 45 + 273.15
+
+
+def synthetic_weather(hours=24, seed=0):
+    # a cold winter day: daily sine around 5°C plus fixed-seed noise, hourly, first and last hour included
+    rng = np.random.default_rng(seed)
+    h = np.arange(hours + 1)
+    return (5 + 5 * np.sin(2 * np.pi * (h - 9) / 24) + rng.normal(0, 1, hours + 1)).tolist()
+
+
+def make_system(T_amb_list):
+    return Heat_system(*house_D, T_amb_list, T_sp, U_cond, T_cond, U_tank, A_tank, c_t, A_cond, cop_model=synthetic_cop_model)
+
+
+def measure(func, repeats, rhs_counter=None):
+    # best-of-repeats wall time, RHS calls per call and peak traced memory of one extra call
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    rhs_calls = None
+    if rhs_counter is not None:
+        rhs_counter[0] = 0
+        func()
+        rhs_calls = rhs_counter[0]
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': min(times), 'median_seconds': float(np.median(times)), 'repeats': repeats,
+            'rhs_calls': rhs_calls, 'peak_memory_bytes': peak}
+
+
+def count_calls(instance, method_name):
+    # wrap an instance method so every call is counted in counter[0]
+    counter = [0]
+    method = getattr(instance, method_name)
+
+    def counted(*args):
+        counter[0] += 1
+        return method(*args)
+    setattr(instance, method_name, counted)
+    return counter
+
+
+def load_optimisation(T_amb_list, directory):
+    # import the Optimisation script (which fetches its weather on import) from an offline store
+    # seeded with the synthetic series for its location and period
+    from meteostat import Point
+    store = weather_store.WeatherStore(directory, offline=True)
+    key = store.key(Point(-1.2864, 36.8172), datetime(2023, 1, 1, 0), datetime(2023, 1, 2, 0))
+    store.save(key, {'time': np.arange(len(T_amb_list)) * 3600, 'temp': np.array(T_amb_list)})
+    previous_store, weather_store.default_store = weather_store.default_store, store
+    try:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Optimisation')
+        loader = SourceFileLoader('Optimisation', path)
+        module = module_from_spec(spec_from_loader('Optimisation', loader))
+        loader.exec_module(module)
+    finally:
+        weather_store.default_store = previous_store
+    return module
+
+
+def run_benchmarks(repeats=5, quick=False):
+    Heat_system.cop_model = synthetic_cop_model
+    T_amb_list = synthetic_weather()
+    results = {}
+
+    system = make_system(T_amb_list)
+    results['Q_load'] = measure(system.Q_load, repeats * 20)
+
+    T_tank = np.array([initial_tank_temp])
+    system = make_system(T_amb_list)
+    results['tank_temperature_ode'] = measure(lambda: system.tank_temperature_ode(40000.0, T_tank), repeats * 200)
+
+    # the analytic solver evaluates closed forms and has no RHS, so it reports no count (None) rather than 0
+    rhs_names = {'rk45': 'tank_temperature_ode', 'events': 'tank_temperature_rhs', 'stratified': 'stratified_rhs'}
+    for solver in heat_system.solvers:
+        system = make_system(T_amb_list)  # the stratified solver uses the default 10 layers
+        counter = count_calls(system, rhs_names[solver]) if solver in rhs_names else None
+
+        def solve():
+            system.pump_on = False  # start every repeat from the same state
+            system.solve_tank_temperature(initial_tank_temp, solver=solver)
+        results[f'solve_tank_temperature[{solver}]'] = measure(solve, repeats, counter)
+
+    backends = [kernels.resolve_backend('auto')] + ['numpy'] * kernels.numba_available  # numpy also when numba is there
+    for backend in backends:
+        system = make_system(T_amb_list)
+
+        def solve():
+            system.pump_on = False
+            system.solve_tank_temperature(initial_tank_temp, backend=backend)
+        results[f'solve_tank_temperature[fixed_step:{backend}]'] = measure(solve, repeats)
+
+    results['run_heat_system_simulation'] = measure(
+        lambda: run_heat_system_simulation(*house_D, T_amb_list, T_sp, U_cond, T_cond, U_tank, A_tank, c_t, A_cond), repeats)
+
+    with tempfile.TemporaryDirectory() as directory:
+        optimisation = load_optimisation(T_amb_list, directory)
+
+    # fixed-seed candidates drawn from the optimisation bounds
+    lower, upper = np.transpose(optimisation.bounds)
+    population = lower + (upper - lower) * np.random.default_rng(1).random((120, len(lower)))
+    results['simulate_population[120]'] = measure(
+        lambda: heat_system.simulate_population(population, T_amb_list, T_cond, c_t, A_cond, initial_tank_temp), repeats)
+    for backend in backends:
+        results[f'simulate_population[120,{backend}]'] = measure(
+            lambda: heat_system.simulate_population(population, T_amb_list, T_cond, c_t, A_cond, initial_tank_temp,
+                                                    backend=backend), repeats)
+
+    results['Optimisation.objective_function'] = measure(lambda: optimisation.objective_function(population[0]), repeats)
+    if not quick:
+        results['differential_evolution[maxiter=3]'] = measure(
+            lambda: optimisation.optimise(T_amb_list, maxiter=3, seed=0), 1)
+
+    return {
+        'meta': {'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+                 'platform': platform.platform(), 'machine': platform.machine(),
+                 'date': datetime.now().isoformat(timespec='seconds')},
+        'benchmarks': results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    # print the speed ratio against the baseline; returns the names that got slower than tolerance allows
+    regressions = []
+    print(f"{'benchmark':40s} {'baseline':>12s} {'current':>12s} {'ratio':>8s}")
+    for name, result in current['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            print(f"{name:40s} {'-':>12s} {result['seconds']:12.6f}")
+            continue
+        base = baseline['benchmarks'][name]['seconds']
+        ratio = result['seconds'] / base if base else float('inf')
+        flag = '  REGRESSION' if ratio > tolerance else ''
+        print(f"{name:40s} {base:12.6f} {result['seconds']:12.6f} {ratio:8.2f}{flag}")
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the heat system simulation and optimisation hot paths")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help="skip the differential evolution run")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON file to compare against")
+    parser.add_argument('--tolerance', type=float, default=1.25, help="allowed slowdown ratio before flagging a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeats, args.quick)
+    for name, result in results['benchmarks'].items():
+        rhs = '' if result['rhs_calls'] is None else f"  rhs calls {result['rhs_calls']}"
+        print(f"{name:40s} {result['seconds'] * 1e3:10.3f} ms  peak {result['peak_memory_bytes'] / 1024:8.1f} KiB{rhs}")
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Results saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
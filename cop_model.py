@@ -0,0 +1,99 @@
+# Heat Pump COP Model
+
+# Capabilities:
+# - Fits the empirical COP curve COP = a + b / (60 - T_amb) to the heat pump data in the YAML file.
+# - Loads and fits lazily, the first time the coefficients are needed (importing costs nothing).
+# - Caches fitted (a, b) on disk keyed by a hash of the YAML content, so the fit runs once per dataset.
+# - Accepts an injected dataset or fixed coefficients instead of the YAML file.
+# - Evaluates the COP for whole arrays of ambient temperatures at once.
+
+# Limitations:
+# - The COP depends on outdoor temperature only (fixed condenser temperature of 60°C in the curve).
+
+import hashlib
+import json
+import os
+import numpy as np
+
+# Load COP data from YAML file
+file_path1 = r'/example/filepath/group6/heat_pump_cop_synthetic_full.yaml' # this is an example filepath, please change it accordingly
+default_yaml_path = os.environ.get('HEAT_COP_YAML', file_path1)
+default_cache_path = os.environ.get('HEAT_COP_CACHE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cop_fit_cache.json'))
+
+
+def cop_curve(T_amb, a, b):
+    # empirical COP relationship using parameters a and b
+    return a + b / (60 - T_amb)
+
+
+class COPModel:
+    def __init__(self, yaml_path=default_yaml_path, data=None, coefficients=None, cache_path=default_cache_path):
+        self.yaml_path = yaml_path  # YAML file with the heat pump COP data
+        self.data = data  # optional (outdoor temperatures, COP values) used instead of the YAML file
+        self.cache_path = cache_path  # JSON file of fitted coefficients keyed by YAML hash (None disables it)
+        self._coefficients = None if coefficients is None else (float(coefficients[0]), float(coefficients[1]))
+
+    @property
+    def coefficients(self):
+        # fitted (a, b), loaded on first use
+        if self._coefficients is None:
+            self._coefficients = self.load()
+        return self._coefficients
+
+    def load(self):
+        if self.data is not None:
+            return self.fit(*self.data)
+
+        with open(self.yaml_path, 'rb') as file:
+            content = file.read()
+        digest = hashlib.sha256(content).hexdigest()
+        cache = self.read_cache()
+        if digest in cache:
+            return tuple(cache[digest])
+
+        import yaml
+        cop_yaml = yaml.safe_load(content)
+        # Pick out data from yaml file
+        cop_temp = [i['outdoor_temp_C'] for i in cop_yaml['heat_pump_cop_data']]  # extract outdoor temperature data
+        cop_cop = [i['COP_noisy'] for i in cop_yaml['heat_pump_cop_data']]  # extract COP (with noise) data
+        coefficients = self.fit(cop_temp, cop_cop)
+
+        cache[digest] = list(coefficients)
+        self.write_cache(cache)
+        return coefficients
+
+    @staticmethod
+    def fit(cop_temp, cop_cop):
+        # fitting empirical COP model to given data
+        from scipy.optimize import curve_fit
+        popt, _ = curve_fit(cop_curve, cop_temp, cop_cop)  # determine values for a and b
+        return float(popt[0]), float(popt[1])
+
+    def read_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}  # an unreadable cache only costs a refit
+
+    def write_cache(self, cache):
+        if not self.cache_path:
+            return
+        try:
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"  # per process, so concurrent writers never share it
+            with open(tmp_path, 'w') as file:
+                json.dump(cache, file)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass  # read-only location: keep the in-memory result
+
+    def __call__(self, T_amb):
+        # COP at one or many ambient temperatures (°C)
+        a, b = self.coefficients
+        return cop_curve(np.asarray(T_amb, dtype=float), a, b)
+
+
+# shared model used by Heat_system unless another one is injected
+default_cop_model = COPModel()
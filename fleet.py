@@ -0,0 +1,288 @@
+# Regional Fleet Simulation (Aggregate Heat Pump Electricity Demand)
+
+# Capabilities:
+# - Simulates a fleet of homes (up to millions) for one day and reports only the aggregate electricity demand profile
+#   and percentile bands of the per-home demand, never per-home trajectories.
+# - Homes come from a table (CSV) or are drawn around the preset house types and spread over the preset cities.
+# - Homes are simulated in chunks with the fused fixed-step kernel (kernels.py); every home of a city shares that
+#   city's weather, fetched once, and each chunk is reduced to fixed-size totals and histograms straight away,
+#   so memory stays flat however large the fleet is.
+# - Chunks run on a process pool (--workers, all cores by default) with a bounded number of chunks in flight,
+#   and the running aggregate is reported as chunks finish.
+
+# Limitations:
+# - One day (midnight to midnight) of hourly weather per city; every home has the same hot water day type.
+# - Percentiles come from histograms with 10 W resolution (demand above 20 kW falls in the last bin).
+# - Condenser and tank loss constants are the same for every home (as in scenarios.py).
+
+# Usage:
+#   python fleet.py --homes 1000000 --date 2023-01-01 --output fleet_profile.csv
+#   python fleet.py --table homes.csv --day-type holiday --workers 8
+#   (table columns: city and either house, for the preset values, or Aw, Uw, Ar, Ur, T_sp, A_tank, tank_mass and
+#   initial_tank_temp; explicit columns override the house preset, blank cells fall back to it)
+
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+from datetime import datetime
+import numpy as np
+import kernels
+from heat_system import Heat_system
+from presets import cities, day_types, hot_water_schedule, house_types
+from scenarios import A_cond, T_cond, U_cond, U_tank, c_water, load_weather
+
+# per-home demand histogram used for the percentile bands
+power_step = 10.0  # histogram bin width (W)
+power_bins = 2001  # bin 0 holds homes drawing nothing, bin k > 0 demand in ((k - 1) 10 W, k 10 W]; the last also anything above 20 kW
+percentiles = (5, 25, 50, 75, 95)
+
+# columns of a home table; the house preset supplies any that are missing
+table_columns = ('Aw', 'Uw', 'Ar', 'Ur', 'T_sp', 'A_tank', 'tank_mass', 'initial_tank_temp')
+
+
+def preset_values(house):
+    # the table columns of a preset house type
+    preset = house_types[house]
+    return {'Aw': preset['Aw'], 'Uw': preset['Uw'], 'Ar': preset['Ar'], 'Ur': preset['Ur'], 'T_sp': preset['T_sp'],
+            'A_tank': preset['Tank Surface Area in m² (A_tank)'], 'tank_mass': preset['Mass of Water in Hot Water Tank in kg'],
+            'initial_tank_temp': preset['Initial Tank Temperature in K']}
+
+
+def sample_homes(city, n, houses, rng, spread=0.15, T_sp_spread=1.0):
+    # n homes in one city, each drawn around a randomly chosen preset house type:
+    # areas, U-values and tank size vary by a log-normal factor (spread is its standard deviation), the set point by
+    # a normal offset (K), and the tanks start anywhere between the pump thresholds so the heat pumps do not all
+    # switch together
+    house = rng.integers(len(houses), size=n)
+    presets = np.array([[preset_values(name)[column] for column in table_columns] for name in houses])[house]
+    homes = {column: presets[:, i] for i, column in enumerate(table_columns)}
+    for column in ('Aw', 'Uw', 'Ar', 'Ur', 'A_tank', 'tank_mass'):
+        homes[column] = homes[column] * rng.lognormal(0.0, spread, n)
+    homes['T_sp'] = homes['T_sp'] + rng.normal(0.0, T_sp_spread, n)
+    homes['initial_tank_temp'] = rng.uniform(kernels.T_pump_on, kernels.T_pump_off, n)
+    homes['city'] = np.full(n, city)
+    return homes
+
+
+def plan_chunks(n_homes, city_names, houses, chunk_size=25000, seed=0, spread=0.15):
+    # the homes to draw, as (city, homes, houses, seed, spread) chunks: homes are spread evenly over the cities at
+    # random and each chunk draws its own homes from its own seed, so no chunk depends on the others
+    counts = np.random.default_rng(seed).multinomial(n_homes, np.full(len(city_names), 1 / len(city_names)))
+    for c, (city, count) in enumerate(zip(city_names, counts)):
+        for k, start in enumerate(range(0, count, chunk_size)):
+            yield (city, min(chunk_size, count - start), houses, (seed, c, k), spread)
+
+
+def read_table(path, chunk_size=25000):
+    # the homes of a CSV table, chunk_size rows at a time, as dicts of columns
+    # blank cells (and missing columns) take the value of the row's house preset
+    import pandas as pd
+    presets = {name: preset_values(name) for name in house_types}
+    for frame in pd.read_csv(path, chunksize=chunk_size):
+        homes = {'city': frame['city'].to_numpy(dtype=str)}
+        unknown = set(homes['city']) - set(cities)
+        if unknown:
+            raise ValueError(f"Unknown cities {sorted(unknown)} in {path}, expected some of {list(cities)}")
+        house = frame['house'] if 'house' in frame else pd.Series(np.nan, index=frame.index)
+        named = house.notna().to_numpy()
+        unknown = set(house[named].astype(str)) - set(house_types)
+        if unknown:
+            raise ValueError(f"Unknown house types {sorted(unknown)} in {path}, expected some of {list(house_types)}")
+        for column in table_columns:
+            if column not in frame and 'house' not in frame:
+                raise ValueError(f"{path} needs a '{column}' or a 'house' column")
+            values = frame[column].to_numpy(dtype=float) if column in frame else np.full(len(frame), np.nan)
+            blank = np.isnan(values)
+            missing = blank & ~named
+            if missing.any():
+                line = frame.index[missing][0] + 2  # after the header line
+                raise ValueError(f"{path} line {line}: no '{column}' value and no house preset to take it from")
+            values[blank] = [presets[name][column] for name in house[blank].astype(str)]
+            homes[column] = values
+        yield homes
+
+
+# per-process copy of the weather, hot water schedule and settings, set once by init_worker
+worker_context = {}
+
+
+def init_worker(weather, schedule, cop_model, city_names, bins, backend, threads=None):
+    worker_context.update(weather=weather, schedule=schedule, city_names=city_names, bins=bins, backend=backend)
+    Heat_system.cop_model = cop_model
+    if threads is not None:
+        kernels.set_threads(threads)
+
+
+def simulate_chunk(chunk):
+    # simulate one chunk of homes (a dict of columns, or a sampling plan from plan_chunks) and reduce it to
+    # fixed-size totals: demand profile (W), per-city demand, per-home demand histogram and energies
+    c = worker_context
+    if isinstance(chunk, tuple):
+        city, n, houses, seed, spread = chunk
+        chunk = sample_homes(city, n, houses, np.random.default_rng(seed), spread)
+    bins, city_names = c['bins'], c['city_names']
+    bin_seconds = 86400 / bins
+    a, b = Heat_system.cop_model.coefficients
+    partial = {'homes': 0, 'demand': np.zeros(bins), 'city_demand': np.zeros((len(city_names), bins)),
+               'city_homes': np.zeros(len(city_names), dtype=np.int64),
+               'histogram': np.zeros((bins, power_bins), dtype=np.int64), 'thermal_energy': 0.0, 'electrical_energy': 0.0}
+
+    for i, city in enumerate(city_names):
+        rows = np.flatnonzero(chunk['city'] == city)
+        if not len(rows):
+            continue
+        T_amb = c['weather'][city]  # shared by every home in the city
+        G = chunk['Aw'][rows] * chunk['Uw'][rows] + chunk['Ar'][rows] * chunk['Ur'][rows]
+        Load = -G[:, None] * (T_amb + 273 - chunk['T_sp'][rows, None]) + c['schedule']  # as Heat_system.Q_load
+        n = len(rows)
+        result = kernels.integrate(T_amb, Load, 86400 / (len(T_amb) - 1), np.full(n, U_tank) * chunk['A_tank'][rows],
+                                   np.full(n, A_cond * U_cond), T_cond, chunk['tank_mass'][rows] * c_water,
+                                   chunk['initial_tank_temp'][rows], np.zeros(n, dtype=bool), 86400, a, b,
+                                   bins=bins, backend=c['backend'])
+        power = result['electrical_profile'] / bin_seconds  # average demand of each home in each bin (W)
+        partial['homes'] += n
+        partial['city_homes'][i] += n
+        partial['city_demand'][i] += power.sum(axis=0)
+        partial['thermal_energy'] += result['thermal_energy'].sum()
+        partial['electrical_energy'] += result['electrical_energy'].sum()
+        level = np.minimum(np.ceil(power / power_step).astype(np.int64), power_bins - 1)
+        partial['histogram'] += np.bincount((np.arange(bins) * power_bins + level).ravel(),
+                                            minlength=bins * power_bins).reshape(bins, power_bins)
+    partial['demand'] = partial['city_demand'].sum(axis=0)
+    partial['skipped'] = len(chunk['city']) - partial['homes']  # homes in cities left out (--cities) or without weather
+    return partial
+
+
+# running totals of a fleet simulation; fixed size whatever the number of homes
+class FleetAggregate:
+    def __init__(self, city_names, bins):
+        self.city_names = list(city_names)
+        self.bins = bins
+        self.homes = 0
+        self.skipped = 0  # homes in cities left out or without weather
+        self.demand = np.zeros(bins)  # total demand of the fleet in each bin (W)
+        self.city_demand = np.zeros((len(city_names), bins))
+        self.city_homes = np.zeros(len(city_names), dtype=np.int64)
+        self.histogram = np.zeros((bins, power_bins), dtype=np.int64)  # homes per 10 W demand level in each bin
+        self.thermal_energy = 0.0  # J
+        self.electrical_energy = 0.0  # J
+
+    def add(self, partial):
+        self.homes += partial['homes']
+        self.skipped += partial['skipped']
+        self.demand += partial['demand']
+        self.city_demand += partial['city_demand']
+        self.city_homes += partial['city_homes']
+        self.histogram += partial['histogram']
+        self.thermal_energy += partial['thermal_energy']
+        self.electrical_energy += partial['electrical_energy']
+
+    def percentile_bands(self, q=percentiles):
+        # per-home demand (W) at each percentile in q for every bin, interpolated within the 10 W histogram bins
+        # (homes drawing nothing are exactly 0 W)
+        cumulative = np.cumsum(self.histogram, axis=1)
+        bands = np.zeros((len(q), self.bins))
+        for i, p in enumerate(q):
+            target = p / 100 * cumulative[:, -1]
+            level = np.minimum((cumulative < target[:, None]).sum(axis=1), power_bins - 1)
+            below = np.where(level > 0, cumulative[np.arange(self.bins), level - 1], 0)
+            in_bin = self.histogram[np.arange(self.bins), level]
+            fraction = np.where(in_bin > 0, (target - below) / np.maximum(in_bin, 1), 0.0)
+            bands[i] = np.where(level > 0, (level - 1 + fraction) * power_step, 0.0)
+        return bands
+
+    def table(self):
+        # the demand profile as columns: bin start (h), fleet demand (MW), mean and percentile demand per home (W)
+        # and the demand of each city (MW)
+        columns = {'hour': np.arange(self.bins) * 24 / self.bins, 'demand_MW': self.demand / 1e6,
+                   'mean_W': self.demand / max(self.homes, 1)}
+        for p, band in zip(percentiles, self.percentile_bands()):
+            columns[f'p{p}_W'] = band
+        for city, demand in zip(self.city_names, self.city_demand):
+            columns[f'{city}_MW'] = demand / 1e6
+        return columns
+
+
+def simulate_fleet(chunks, weather, schedule, bins=96, workers=1, backend='auto'):
+    # simulate every chunk (dicts of columns or plan_chunks tuples) and yield the running FleetAggregate after each one
+    # at most two chunks per worker are queued at a time, so a lazily read table is never all in memory
+    city_names = list(weather)
+    aggregate = FleetAggregate(city_names, bins)
+    Heat_system.cop_model.coefficients  # fit once here rather than in every worker
+    initargs = (weather, schedule, Heat_system.cop_model, city_names, bins, backend)
+
+    if workers > 1:
+        # one kernel thread per process; the pool already uses every core
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=initargs + (1,)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(simulate_chunk, (chunk,)))
+                if len(pending) >= 2 * workers:
+                    aggregate.add(pending.popleft().get())
+                    yield aggregate
+            while pending:
+                aggregate.add(pending.popleft().get())
+                yield aggregate
+    else:
+        init_worker(*initargs)
+        for chunk in chunks:
+            aggregate.add(simulate_chunk(chunk))
+            yield aggregate
+
+
+def save_profile(path, aggregate):
+    # write the profile table as CSV; a temporary file first so an interrupted run never leaves a truncated file
+    columns = aggregate.table()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    np.savetxt(tmp_path, np.column_stack(list(columns.values())), delimiter=',', header=','.join(columns), comments='',
+               fmt='%.6g')
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate heat pump electricity demand of a fleet of homes")
+    parser.add_argument('--homes', type=int, default=100000, help="number of homes to draw around the presets")
+    parser.add_argument('--table', help="CSV table of homes to simulate instead of drawing them")
+    parser.add_argument('--cities', nargs='+', default=list(cities), choices=list(cities))
+    parser.add_argument('--houses', nargs='+', default=list(house_types), choices=list(house_types))
+    parser.add_argument('--spread', type=float, default=0.15, help="relative spread of the drawn house parameters")
+    parser.add_argument('--date', default='2023-01-01', help="day to simulate (YYYY-MM-DD)")
+    parser.add_argument('--day-type', default='weekday', choices=day_types, help="hot water profile of every home")
+    parser.add_argument('--bins', type=int, default=96, help="time bins of the demand profile (96 = 15 minutes)")
+    parser.add_argument('--chunk-size', type=int, default=25000, help="homes per chunk")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument('--backend', default='auto', choices=kernels.backends)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='fleet_profile.csv')
+    args = parser.parse_args()
+
+    date = datetime.fromisoformat(args.date)
+    weather = {city: T_amb for (city, _), T_amb in load_weather(args.cities, [date]).items()}
+    if args.table:
+        chunks = read_table(args.table, args.chunk_size)
+        total = None
+    else:
+        chunks = plan_chunks(args.homes, list(weather), args.houses, args.chunk_size, args.seed, args.spread)
+        total = args.homes
+
+    start = time.perf_counter()
+    aggregate = None
+    for aggregate in simulate_fleet(chunks, weather, hot_water_schedule(args.day_type), args.bins, args.workers,
+                                    args.backend):
+        print(f"{aggregate.homes}{'' if total is None else f' / {total}'} homes, "
+              f"{time.perf_counter() - start:.0f} s", flush=True)
+    if aggregate is None or not aggregate.homes:
+        print("No homes simulated")
+        return
+    if aggregate.skipped:
+        print(f"Skipped {aggregate.skipped} homes in cities not simulated (not in --cities or no weather for {args.date})")
+    save_profile(args.output, aggregate)
+    peak = np.argmax(aggregate.demand)
+    print(f"{aggregate.homes} homes: {aggregate.electrical_energy / 3.6e9:.1f} MWh of electricity, "
+          f"peak {aggregate.demand[peak] / 1e6:.1f} MW at {peak * 24 / args.bins:.2f} h; profile written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+# Compute Backends for the Fused Fixed-Step Tank Kernel
+
+# Capabilities:
+# - Integrates one or many single-node tanks with a fixed step in one fused loop: forcing interpolation,
+#   hysteresis (switch times refined inside the step), the exact exponential update and energy accumulation.
+# - 'numba' backend: the loop is JIT-compiled (and run in parallel over tanks) when numba is installed.
+# - 'numpy' backend, used automatically without numba: a few tanks are stepped as a linear recurrence between
+#   switches (whole runs of steps per call), many tanks are advanced together one step at a time.
+# - Optionally accumulates each tank's electricity use in equal time bins (a demand profile), without storing series.
+
+# Limitations:
+# - Forcing is treated as linear within each step, so steps should divide the forcing interval
+#   (the 60 s default divides an hour).
+# - Within a step the model is solved exactly, so temperatures, switch times and heat do not depend on the step size
+#   or on the tank's time constant (c_t / (U_cond A_cond + U_tank A_tank), a few minutes for small tanks) beyond
+#   rounding. Only the electricity is approximate: 1/COP is weighted by the heat pump output at the step ends, within
+#   about 2e-7 of the exact integral at 60 s steps even for tanks that cycle every few minutes.
+#   RK45 differs from this by its own error (up to about 0.5% in energy and 1 K near pump switches).
+
+import math
+import numpy as np
+from scipy.signal import lfilter
+
+try:
+    import numba
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+backends = ('auto', 'numpy', 'numba')
+numba_available = njit is not None
+
+# hysteresis thresholds (K), the same as heat_system.T_pump_on / T_pump_off
+T_pump_on = 40 + 273.15
+T_pump_off = 60 + 273.15
+
+# below this many tanks the numpy backend integrates tank by tank (integrate_series), above it step by step
+series_tanks = 64
+# stepping many tanks, up to this many tanks switching inside one step are handled one by one
+scalar_switches = 8
+
+
+def resolve_backend(backend):
+    # the backend to use: 'auto' picks numba when it is installed
+    if backend not in backends:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {backends}")
+    if backend == 'numba' and not numba_available:
+        raise ImportError("The numba backend needs numba installed (pip install numba)")
+    if backend == 'auto':
+        return 'numba' if numba_available else 'numpy'
+    return backend
+
+
+def set_threads(threads):
+    # limit the threads the numba backend runs tanks on (e.g. one per process when a process pool shares the cores)
+    if numba_available:
+        numba.set_num_threads(threads)
+
+
+def tank_temperature(tau, T0, k, g0, g1):
+    # exact solution of dT/dtau = -k T + g0 + g1 tau with T(0) = T0 (scalar form of heat_system.exact_tank_temperature)
+    if k > 0:
+        p1 = g1 / k
+        p0 = (g0 - p1) / k
+        return p0 + p1 * tau + (T0 - p0) * math.exp(-k * tau)
+    return T0 + g0 * tau + 0.5 * g1 * tau * tau
+
+
+def tank_temperatures(tau, T0, k, g0, g1):
+    # array form of tank_temperature
+    k_safe = np.where(k > 0, k, 1.0)
+    p1 = g1 / k_safe
+    p0 = (g0 - p1) / k_safe
+    return np.where(k > 0, p0 + p1 * tau + (T0 - p0) * np.exp(-k_safe * tau), T0 + g0 * tau + 0.5 * g1 * tau ** 2)
+
+
+def temperature_integral(tau, T0, k, g0, g1):
+    # integral of tank_temperature over [0, tau], so the heat delivered over a step is exact
+    if k > 0:
+        p1 = g1 / k
+        p0 = (g0 - p1) / k
+        return p0 * tau + 0.5 * p1 * tau * tau - (T0 - p0) * math.expm1(-k * tau) / k
+    return T0 * tau + 0.5 * g0 * tau * tau + g1 * tau * tau * tau / 6
+
+
+def temperature_integrals(tau, T0, k, g0, g1):
+    # array form of temperature_integral
+    k_safe = np.where(k > 0, k, 1.0)
+    p1 = g1 / k_safe
+    p0 = (g0 - p1) / k_safe
+    return np.where(k > 0, p0 * tau + 0.5 * p1 * tau ** 2 - (T0 - p0) * np.expm1(-k_safe * tau) / k_safe,
+                    T0 * tau + 0.5 * g0 * tau ** 2 + g1 * tau ** 3 / 6)
+
+
+def electricity(heat, Q0, Q1, cop0, cop1):
+    # electricity for the heat delivered over a step: the heat over the COP, with 1/COP averaged over the step
+    # weighted by the heat pump output at its ends (works on scalars and arrays)
+    total = Q0 + Q1
+    return np.where(total != 0, heat * (Q0 / cop0 + Q1 / cop1) / np.where(total != 0, total, 1.0), 0.0)
+
+
+def advance(T, on, t, dt, T_amb, Load, grid_dt, UA, h_on, T_cond, c_t, a, b, switches, count):
+    # advance one tank from t to t + dt, switching the pump (possibly more than once) where it reaches a threshold
+    # T_amb and Load are the forcing tables (linear interpolation, clamped after the last entry); switching times
+    # are written into switches while there is room
+    # returns (temperature, pump state, switch count, heat delivered, electricity used) for the step
+    last = T_amb.shape[0] - 1
+    Q_thermal = 0.0
+    Q_electric = 0.0
+    tau_done = 0.0
+    while True:
+        s = t + tau_done
+        j = min(int(s / grid_dt), last)
+        if j >= last:
+            Ta, La, sT, sL = T_amb[last], Load[last], 0.0, 0.0
+        else:
+            sT = (T_amb[j + 1] - T_amb[j]) / grid_dt
+            sL = (Load[j + 1] - Load[j]) / grid_dt
+            Ta = T_amb[j] + sT * (s - j * grid_dt)
+            La = Load[j] + sL * (s - j * grid_dt)
+        h = h_on if on else 0.0
+        k = (h + UA) / c_t
+        g0 = (h * T_cond - La + UA * Ta) / c_t
+        g1 = (UA * sT - sL) / c_t
+        width = dt - tau_done
+        T1 = tank_temperature(width, T, k, g0, g1)
+
+        crossed = (on and T1 >= T_pump_off) or ((not on) and T1 <= T_pump_on)
+        tau = width
+        if crossed:
+            # Newton on the closed form from linear interpolation, to find where the threshold is reached
+            threshold = T_pump_off if on else T_pump_on
+            tau = width * (threshold - T) / (T1 - T) if T1 != T else 0.0
+            for _ in range(4):
+                T_tau = tank_temperature(tau, T, k, g0, g1)
+                slope = g0 + g1 * tau - k * T_tau
+                if slope != 0.0:
+                    tau = min(max(tau - (T_tau - threshold) / slope, 0.0), width)
+            T1 = threshold
+
+        # heat pump energy over [s, s + tau]: the heat exactly, the electricity as in electricity()
+        if on:
+            Q0 = h * (T_cond - T)
+            Q1 = h * (T_cond - T1)
+            heat = h * (T_cond * tau - temperature_integral(tau, T, k, g0, g1))
+            Q_thermal += heat
+            if Q0 + Q1 != 0.0:
+                Q_electric += heat * (Q0 / (a + b / (60 - Ta)) + Q1 / (a + b / (60 - (Ta + sT * tau)))) / (Q0 + Q1)
+        T = T1
+        if not crossed:
+            return T, on, count, Q_thermal, Q_electric
+        on = not on
+        if count < switches.shape[0]:
+            switches[count] = s + tau
+        count += 1
+        tau_done += tau
+
+
+def integrate_loops(T_amb, Load, grid_dt, UA, h_on, T_cond, c_t, T0, pump_on, dt, n_steps, a, b,
+                    record, T_steps, switch_times, n_switches, thermal, electrical, T_end, pump_end, profile):
+    # scalar loops over tanks and steps (the form numba compiles); results are written into the output arrays
+    # profile (N, bins) collects the electricity of each step in the bin its start falls in (bins may be 0)
+    n_bins = profile.shape[1]
+    for i in prange(T0.shape[0]):
+        T = T0[i]
+        on = pump_on[i]
+        if T >= T_pump_off:
+            on = False
+        elif T <= T_pump_on:
+            on = True
+        count = 0
+        Q_thermal = 0.0
+        Q_electric = 0.0
+        if record:
+            T_steps[i, 0] = T
+        for n in range(n_steps):
+            T, on, count, dQ, dE = advance(T, on, n * dt, dt, T_amb, Load[i], grid_dt, UA[i], h_on[i], T_cond, c_t[i],
+                                           a, b, switch_times[i], count)
+            Q_thermal += dQ
+            Q_electric += dE
+            if n_bins > 0:
+                profile[i, n * n_bins // n_steps] += dE
+            if record:
+                T_steps[i, n + 1] = T
+        n_switches[i] = count
+        thermal[i] = Q_thermal
+        electrical[i] = Q_electric
+        T_end[i] = T
+        pump_end[i] = on
+
+
+if numba_available:
+    tank_temperature = njit(cache=True)(tank_temperature)
+    temperature_integral = njit(cache=True)(temperature_integral)
+    advance = njit(cache=True)(advance)
+    compiled_loops = njit(cache=True, parallel=True)(integrate_loops)
+
+
+def step_forcing(T_amb, Load, grid_dt, dt, n_steps):
+    # ambient temperature and load (and their slopes) at the start of every step; Load may be one row or (N, M)
+    last = len(T_amb) - 1
+    s = np.arange(n_steps) * dt
+    j = np.minimum((s / grid_dt).astype(np.int64), last)
+    jn = np.minimum(j + 1, last)
+    offset = np.where(j < last, s - j * grid_dt, 0.0)
+    sT = (T_amb[jn] - T_amb[j]) / grid_dt
+    sL = (Load[..., jn] - Load[..., j]) / grid_dt
+    return T_amb[j] + sT * offset, sT, Load[..., j] + sL * offset, sL
+
+
+def integrate_series(T_amb, Load, grid_dt, UA, h_on, T_cond, c_t, T0, pump_on, dt, n_steps, a, b,
+                     record, T_steps, switch_times, n_switches, thermal, electrical, T_end, pump_end, profile):
+    # tank by tank: with the pump state fixed, whole steps follow the linear recurrence T[n+1] = d T[n] + c[n]
+    # (d the decay over one step), which lfilter evaluates for every remaining step at once; the first step that
+    # reaches a threshold is redone with advance and the recurrence restarts after it with the other pump state
+    Ta, sT, _, _ = step_forcing(T_amb, Load[0], grid_dt, dt, n_steps)
+    cop0, cop1 = a + b / (60 - Ta), a + b / (60 - (Ta + sT * dt))
+    n_bins = profile.shape[1]
+    step_bins = np.arange(n_steps) * n_bins // n_steps
+    for i in range(len(T0)):
+        _, _, La, sL = step_forcing(T_amb, Load[i], grid_dt, dt, n_steps)
+        T = float(T0[i])
+        on = bool(T < T_pump_off and (T <= T_pump_on or pump_on[i]))
+        count, Q_thermal, Q_electric = 0, 0.0, 0.0
+        T_series = np.empty(n_steps + 1)
+        T_series[0] = T
+        n = 0
+        while n < n_steps:
+            h = h_on[i] if on else 0.0
+            k = (h + UA[i]) / c_t[i]
+            g0 = (h * T_cond - La[n:] + UA[i] * Ta[n:]) / c_t[i]
+            g1 = (UA[i] * sT[n:] - sL[n:]) / c_t[i]
+            if k > 0:
+                decay = math.exp(-k * dt)
+                p1 = g1 / k
+                p0 = (g0 - p1) / k
+                c = p0 * (1 - decay) + p1 * dt
+            else:
+                decay, c = 1.0, g0 * dt + 0.5 * g1 * dt ** 2
+            T_next = lfilter([1.0], [1.0, -decay], c, zi=[decay * T])[0]
+            crossed = np.flatnonzero(T_next >= T_pump_off if on else T_next <= T_pump_on)
+            m = crossed[0] if len(crossed) else len(T_next)  # whole steps before the first switch
+
+            T_series[n + 1:n + m + 1] = T_next[:m]
+            if on and m:
+                Q = h * (T_cond - T_series[n:n + m + 1])
+                heat = h * (T_cond * dt - temperature_integrals(dt, T_series[n:n + m], k, g0[:m], g1[:m]))
+                Q_thermal += heat.sum()
+                E = electricity(heat, Q[:-1], Q[1:], cop0[n:n + m], cop1[n:n + m])
+                Q_electric += E.sum()
+                if n_bins:
+                    profile[i] += np.bincount(step_bins[n:n + m], E, minlength=n_bins)
+            n += m
+            if n < n_steps:
+                T, on, count, dQ, dE = advance(T_series[n], on, n * dt, dt, T_amb, Load[i], grid_dt, UA[i], h_on[i], T_cond,
+                                               c_t[i], a, b, switch_times[i], count)
+                Q_thermal += dQ
+                Q_electric += dE
+                if n_bins:
+                    profile[i, step_bins[n]] += dE
+                T_series[n + 1] = T
+                n += 1
+            T = T_series[n]
+        if record:
+            T_steps[i] = T_series
+        n_switches[i] = count
+        thermal[i] = Q_thermal
+        electrical[i] = Q_electric
+        T_end[i] = T
+        pump_end[i] = on
+
+
+def integrate_numpy(T_amb, Load, grid_dt, UA, h_on, T_cond, c_t, T0, pump_on, dt, n_steps, a, b,
+                    record, T_steps, switch_times, n_switches, thermal, electrical, T_end, pump_end, profile):
+    # every tank advanced at once, one step at a time; the tanks that reach a threshold inside a step redo it
+    # with advance when there are few of them, otherwise together, switch by switch (advance's algorithm on arrays)
+    N = len(T0)
+    T = T0.astype(float).copy()
+    on = np.where(T >= T_pump_off, False, np.where(T <= T_pump_on, True, pump_on))
+    count = np.zeros(N, dtype=np.int64)
+    Q_thermal = np.zeros(N)
+    Q_electric = np.zeros(N)
+    n_bins = profile.shape[1]
+    # per-tank constants of the two pump states (the decay over a step only depends on the state)
+    k_on, k_off = (h_on + UA) / c_t, UA / c_t
+    decay_on, decay_off = np.exp(-k_on * dt), np.exp(-k_off * dt)
+    span_on = -np.expm1(-k_on * dt) / np.where(k_on > 0, k_on, 1.0)  # integral of the decay over a step (pump on)
+    Ta_steps, sT_steps, _, _ = step_forcing(T_amb, Load[0], grid_dt, dt, n_steps)
+    Load_columns = np.ascontiguousarray(Load.T)  # each time's loads contiguous
+    last = len(T_amb) - 1
+    if record:
+        T_steps[:, 0] = T
+    for n in range(n_steps):
+        t = n * dt
+        Ta, sT = Ta_steps[n], sT_steps[n]
+        j = min(int(t / grid_dt), last)
+        jn = min(j + 1, last)
+        sL = (Load_columns[jn] - Load_columns[j]) / grid_dt
+        La = Load_columns[j] + sL * (t - j * grid_dt if j < last else 0.0)
+        h = np.where(on, h_on, 0.0)
+        k = np.where(on, k_on, k_off)
+        g0 = (h * T_cond - La + UA * Ta) / c_t
+        g1 = (UA * sT - sL) / c_t
+        k_safe = np.where(k > 0, k, 1.0)
+        p1 = g1 / k_safe
+        p0 = (g0 - p1) / k_safe
+        T1 = np.where(k > 0, p0 + p1 * dt + (T - p0) * np.where(on, decay_on, decay_off), T + g0 * dt + 0.5 * g1 * dt ** 2)
+        Q0, Q1 = h * (T_cond - T), h * (T_cond - T1)
+        dQ = h * (T_cond * dt - (p0 * dt + 0.5 * p1 * dt ** 2 + (T - p0) * span_on))  # h is 0 with the pump off
+        inv_cop0, inv_cop1 = 1 / (a + b / (60 - Ta)), 1 / (a + b / (60 - (Ta + sT * dt)))
+        total = Q0 + Q1
+        dE = dQ * (inv_cop1 + (inv_cop0 - inv_cop1) * Q0 / np.where(total != 0, total, 1.0))  # as electricity()
+
+        active = np.flatnonzero(np.where(on, T1 >= T_pump_off, T1 <= T_pump_on))
+        if len(active) <= scalar_switches:
+            # a handful of switching tanks are quicker one by one than with the array operations below
+            for i in active:
+                T1[i], on[i], count[i], dQ[i], dE[i] = advance(T[i], on[i], t, dt, T_amb, Load[i], grid_dt, UA[i], h_on[i],
+                                                               T_cond, c_t[i], a, b, switch_times[i], count[i])
+            active = active[:0]
+        dQ[active] = dE[active] = 0.0
+        T1[active] = T[active]
+        tau_done = np.zeros(len(active))
+        while len(active):
+            # redo the rest of the step for the switching tanks from where they are
+            s = t + tau_done
+            j_a = np.minimum((s / grid_dt).astype(np.int64), last)
+            jn_a = np.minimum(j_a + 1, last)
+            offset = np.where(j_a < last, s - j_a * grid_dt, 0.0)
+            sT_a = (T_amb[jn_a] - T_amb[j_a]) / grid_dt
+            sL_a = (Load[active, jn_a] - Load[active, j_a]) / grid_dt
+            Ta_a = T_amb[j_a] + sT_a * offset
+            La_a = Load[active, j_a] + sL_a * offset
+            T_a, on_a = T1[active], on[active]
+            h_a = np.where(on_a, h_on[active], 0.0)
+            k_a = (h_a + UA[active]) / c_t[active]
+            g0_a = (h_a * T_cond - La_a + UA[active] * Ta_a) / c_t[active]
+            g1_a = (UA[active] * sT_a - sL_a) / c_t[active]
+            width = dt - tau_done
+            T_new = tank_temperatures(width, T_a, k_a, g0_a, g1_a)
+
+            crossed = np.where(on_a, T_new >= T_pump_off, T_new <= T_pump_on)
+            threshold = np.where(on_a, T_pump_off, T_pump_on)
+            # Newton on the closed form from linear interpolation, to find where the threshold is reached
+            delta = T_new - T_a
+            tau = np.where(crossed & (delta != 0), width * (threshold - T_a) / np.where(delta != 0, delta, 1.0), 0.0)
+            for _ in range(4):
+                T_tau = tank_temperatures(tau, T_a, k_a, g0_a, g1_a)
+                slope = g0_a + g1_a * tau - k_a * T_tau
+                tau = np.clip(tau - (T_tau - threshold) / np.where(slope != 0, slope, np.inf), 0, width)
+            tau = np.where(crossed, tau, width)
+            T_new = np.where(crossed, threshold, T_new)
+
+            Q0, Q1 = h_a * (T_cond - T_a), h_a * (T_cond - T_new)
+            heat = h_a * (T_cond * tau - temperature_integrals(tau, T_a, k_a, g0_a, g1_a))
+            dQ[active] += heat
+            dE[active] += electricity(heat, Q0, Q1, a + b / (60 - Ta_a), a + b / (60 - (Ta_a + sT_a * tau)))
+            T1[active] = T_new
+
+            switched = active[crossed]
+            if record and len(switched):
+                switch_times[switched, count[switched]] = s[crossed] + tau[crossed]
+            count[switched] += 1
+            on[switched] = ~on[switched]
+            tau_done = tau_done[crossed] + tau[crossed]
+            active = switched
+        T = T1
+        Q_thermal += dQ
+        Q_electric += dE
+        if n_bins:
+            profile[:, n * n_bins // n_steps] += dE
+        if record:
+            T_steps[:, n + 1] = T
+    n_switches[:] = count
+    thermal[:] = Q_thermal
+    electrical[:] = Q_electric
+    T_end[:] = T
+    pump_end[:] = on
+
+
+def integrate(T_amb, Load, grid_dt, UA, h_on, T_cond, c_t, T0, pump_on, total_time, a, b, dt=60.0, record=False,
+              bins=0, backend='auto'):
+    # integrate N tanks over [0, total_time] with (about) dt second steps
+    # T_amb (M,) ambient temperatures (°C) and Load (N, M) loads (W) on a uniform grid with spacing grid_dt;
+    # UA, h_on (condenser conductance while on), c_t, T0 and pump_on (initial state) are (N,) arrays
+    # returns a dict with the thermal and electrical energy (J), final temperatures and pump states and the switch counts;
+    # with record=True also the step times, the temperature after every step and each tank's switching times;
+    # bins > 0 adds each tank's electricity (J) in that many equal time bins ('electrical_profile', (N, bins))
+    backend = resolve_backend(backend)
+    N = len(T0)
+    n_steps = max(int(math.ceil(total_time / dt - 1e-9)), 1)
+    dt = total_time / n_steps  # end exactly at total_time
+    T_amb, Load, UA, h_on, c_t, T0 = [np.ascontiguousarray(x, dtype=float)
+                                      for x in (T_amb, np.atleast_2d(Load), UA, h_on, c_t, T0)]
+    pump_on = np.ascontiguousarray(pump_on, dtype=np.bool_)
+    T_steps = np.empty((N, n_steps + 1) if record else (N, 0))
+    switch_times = np.empty((N, 2 * n_steps) if record else (N, 0))  # at most two switches per step
+    n_switches = np.zeros(N, dtype=np.int64)
+    thermal, electrical, T_end = np.zeros(N), np.zeros(N), np.zeros(N)
+    pump_end = np.zeros(N, dtype=np.bool_)
+    profile = np.zeros((N, bins))
+
+    if backend == 'numba':
+        loops = compiled_loops
+    else:
+        loops = integrate_series if N < series_tanks else integrate_numpy
+    loops(T_amb, Load, float(grid_dt), UA, h_on, float(T_cond), c_t, T0, pump_on, float(dt), n_steps, float(a), float(b),
+          record, T_steps, switch_times, n_switches, thermal, electrical, T_end, pump_end, profile)
+
+    result = {'thermal_energy': thermal, 'electrical_energy': electrical, 'T_end': T_end, 'pump_on': pump_end,
+              'n_switches': n_switches}
+    if bins:
+        result['electrical_profile'] = profile
+    if record:
+        result['t_steps'] = np.linspace(0, total_time, n_steps + 1)
+        result['T_steps'] = T_steps
+        result['switch_times'] = [switch_times[i, :n_switches[i]] for i in range(N)]
+    return result
@@ -13,51 +13,88 @@
 
 import tkinter as tk
 from tkinter import ttk
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from meteostat import Point, Hourly
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from heat_system import run_heat_system_simulation
-
-# Define coordinates for additional cities
-cities = {
-    'Edinburgh': Point(55.9533, -3.1883),
-    'Oslo': Point(59.9139, 10.7522),
-    'Harbin': Point(45.8038, 126.5347),
-    'Toronto': Point(43.65107, -79.347015),
-    'Nairobi': Point(-1.286389, 36.817223),
-    'Rio de Janeiro': Point(-22.9068, -43.1729),
-    'Cape Town': Point(-33.9249, 18.4241)
-}
+from presets import cities, house_types
+from weather_store import get_temperatures
 
 # Define T_amb_list as a global variable
 T_amb_list = []
 
-# Function to get temperature for selected city
-def get_temperature_for_city(city_name):
-    global T_amb_list
+# Function to load temperatures for a city (safe to call from a background thread)
+def load_temperatures(city_name):
     location = cities.get(city_name)
     if location:
         start = datetime(2023, 1, 1, 0)
         end = datetime(2023, 1, 2, 0)
-        data = Hourly(location, start, end).fetch()
-        T_amb_list = data['temp'].tolist()
-        return T_amb_list
+        return get_temperatures(location, start, end)  # served from the local weather cache after the first fetch
     else:
         return []
 
+# Function to get temperature for selected city
+def get_temperature_for_city(city_name):
+    global T_amb_list
+    T_amb_list = load_temperatures(city_name)
+    return T_amb_list
+
+# Runs slow work (weather fetches, simulations) off the Tk main thread.
+# Results are handed back on the main thread via root.after; a newer job on the same channel
+# supersedes older ones, whose results are dropped (queued ones are cancelled outright)
+class BackgroundWorker:
+    def __init__(self, root, poll_ms=50):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.jobs = {}  # latest job number per channel
+
+    def submit(self, channel, func, args, on_done, on_error=None):
+        job = self.jobs.get(channel, 0) + 1
+        self.jobs[channel] = job
+        future = self.executor.submit(func, *args)
+
+        def poll():
+            if self.jobs.get(channel) != job:
+                future.cancel()  # superseded by a newer job or cancelled
+                return
+            if not future.done():
+                self.root.after(self.poll_ms, poll)
+                return
+            error = future.exception()
+            if error is None:
+                on_done(future.result())
+            elif on_error is not None:
+                on_error(error)
+            else:
+                print(f"Background {channel} job failed: {error}")
+
+        self.root.after(self.poll_ms, poll)
+
+    def cancel(self, channel):
+        self.jobs[channel] = self.jobs.get(channel, 0) + 1  # any pending result on this channel is dropped
+
 # Function to update temperature based on selected city
 def update_temperature():
     selected_city = city_var.get()
-    global T_amb_list  # Declare as global to use the updated list
-    T_amb_list = get_temperature_for_city(selected_city)
-    if T_amb_list:
-        print(f"Temperature data for {selected_city} fetched successfully!")
-        # Update the outside temperature display
-        outside_temp_entry.delete(0, tk.END)
-        outside_temp_entry.insert(0, f"{T_amb_list[0]:.2f}")
-    else:
-        print(f"Failed to fetch temperature data for {selected_city}.")
+    worker.cancel('simulation')  # the inputs changed, so a running simulation is out of date
+
+    def on_done(temperatures):
+        global T_amb_list  # Declare as global to use the updated list
+        T_amb_list = temperatures
+        if T_amb_list:
+            print(f"Temperature data for {selected_city} fetched successfully!")
+            # Update the outside temperature display
+            outside_temp_entry.delete(0, tk.END)
+            outside_temp_entry.insert(0, f"{T_amb_list[0]:.2f}")
+        else:
+            print(f"Failed to fetch temperature data for {selected_city}.")
+
+    def on_error(error):
+        print(f"Failed to fetch temperature data for {selected_city}: {error}")
+
+    worker.submit('weather', load_temperatures, (selected_city,), on_done, on_error)
 
 # Tkinter UI creation code
 root = tk.Tk()
@@ -66,6 +103,7 @@ root.geometry("1400x800")
 root.state('zoomed')
 root.grid_rowconfigure(0, weight=1)
 root.grid_columnconfigure(0, weight=1)
+worker = BackgroundWorker(root)
 
 # Frame for Parameters
 frame_params = tk.Frame(root, bd=2, relief=tk.GROOVE)
@@ -98,11 +136,8 @@ def set_parameters(params):
     # Set the City value (for use in fetching outside temperature)
     city_var.set(params['City'])
 
-    # Fetch and display outside temperature for the city
-    outside_temp = update_temperature_display(params['City'])
-    # Update the outside temperature entry field
-    outside_temp_entry.delete(0, tk.END)
-    outside_temp_entry.insert(0, outside_temp)
+    # Fetch and display outside temperature for the city (in the background)
+    update_temperature()
 
 # Parameter labels and entries
 parameters = [
@@ -149,33 +184,6 @@ def on_house_selection_change(event):
 
 # Dropdown menu for Building Types
 tk.Label(frame_params, text="House Type:").grid(row=14, column=0, sticky='e')
-house_types = {
-    'A': {'Aw': 85, 'Uw': 0.4, 'Ar': 80, 'Ur': 0.15, 'T_sp': 288.15,
-          'Mass of Water in Hot Water Tank in kg': 160, 
-          'Initial Tank Temperature in K': 318.15,
-          'Heat Pump On Threshold in K': 313.15, 
-          'Heat Pump Off Threshold in K': 333.15,
-          'Tank Surface Area in m² (A_tank)': 0.8, 'City': 'Harbin', 'Outside Temp': 0},
-    'B': {'Aw': 135, 'Uw': 0.6, 'Ar': 120, 'Ur': 0.25, 'T_sp': 298.15,
-          'Mass of Water in Hot Water Tank in kg': 200,
-          'Initial Tank Temperature in K': 318.15,
-          'Heat Pump On Threshold in K': 313.15, 
-          'Heat Pump Off Threshold in K': 333.15,
-          'Tank Surface Area in m² (A_tank)': 1, 'City': 'Nairobi', 'Outside Temp': 0},
-    'C': {'Aw': 180, 'Uw': 0.8, 'Ar': 160, 'Ur': 0.3, 'T_sp': 303.15,
-          'Mass of Water in Hot Water Tank in kg': 240, 
-          'Initial Tank Temperature in K': 318.15,
-          'Heat Pump On Threshold in K': 313.15, 
-          'Heat Pump Off Threshold in K': 333.15,
-          'Tank Surface Area in m² (A_tank)': 1.2, 'City': 'Rio de Janeiro', 'Outside Temp': 0},
-    'D': {'Aw': 132, 'Uw': 0.51, 'Ar': 120, 'Ur': 0.18, 'T_sp': 293.15,
-          'Mass of Water in Hot Water Tank in kg': 200, 
-          'Initial Tank Temperature in K': 318.15,
-          'Heat Pump On Threshold in K': 313.15, 
-          'Heat Pump Off Threshold in K': 333.15,
-          'Tank Surface Area in m² (A_tank)': 1, 'City': 'Edinburgh', 'Outside Temp': 0},
-}
-
 # Add the city selection dropdown
 tk.Label(frame_params, text="Select City for Outside Temperature:").grid(row=12, column=0, sticky='e')
 city_var = tk.StringVar(value="Please Select")  
@@ -187,50 +195,27 @@ house_dropdown = ttk.Combobox(frame_params, textvariable=house_var, values=list(
 house_dropdown.grid(row=14, column=1, pady=5, padx=5)
 house_dropdown.bind("<<ComboboxSelected>>", on_house_selection_change)
 
-# Function to run the simulation
+# Function to run the simulation (the solve runs in the background, the plots update when it finishes)
 def run_simulation(Aw, Uw, Ar, Ur, T_sp, U_cond, T_cond, U_tank, A_tank, c_t, A_cond):
     if not T_amb_list:
         print("Temperature data not available!")
         return
 
-    time_values, T_tank_values, Q_hp_total, avg_cop, cop_values = run_heat_system_simulation(
-        Aw, Uw, Ar, Ur, T_amb_list, T_sp, U_cond, T_cond, U_tank, A_tank, c_t, A_cond
-    )
-
-    # Plotting and embedding plots in tkinter
-    fig, ax = plt.subplots(figsize=(5.5, 3.75))
-    ax.plot(time_values / 3600, T_tank_values, label="Tank Temperature", linewidth=1.5)
-    ax.axhline(y=60, color="red", linestyle="--", label="Heat Pump Off Threshold (60°C)", linewidth=1)
-    ax.axhline(y=40, color="blue", linestyle="--", label="Heat Pump On Threshold (40°C)", linewidth=1)
-    ax.set_xlabel("Time (hours)", fontsize=10)
-    ax.set_ylabel("Tank Temperature (°C)", fontsize=10)
-    ax.set_xlim(0, 24)
-    ax.set_ylim(35, 70)
-    ax.set_xticks(range(0, 25, 4))
-    ax.tick_params(axis='both', labelsize=9)
-    ax.legend(loc="upper right", fontsize=9)
-    ax.grid(True)
-    plt.tight_layout()
-
-    canvas = FigureCanvasTkAgg(fig, master=frame_temperature_plot)
-    canvas.draw()
-    canvas.get_tk_widget().grid(row=1, column=0, pady=10)
-
-    # COP Plot
-    fig2, ax2 = plt.subplots(figsize=(5.5, 3))
-    ax2.plot(time_values / 3600, cop_values, label='COP', color='purple')
-    ax2.set_xlabel('Time (hours)', fontsize=9)
-    ax2.set_ylabel('COP', fontsize=9)
-    ax2.set_xlim(0, 24)
-    ax2.set_xticks(range(0, 25, 4))
-    ax2.tick_params(axis='both', labelsize=9)
-    ax2.set_title('Coefficient of Performance (COP) vs Time', fontsize=10)
-    ax2.grid(True)
-    plt.tight_layout()
-
-    canvas2 = FigureCanvasTkAgg(fig2, master=frame_performance_metrics)
-    canvas2.draw()
-    canvas2.get_tk_widget().grid(row=1, column=0, pady=10)
+    worker.submit('simulation', run_heat_system_simulation,
+                  (Aw, Uw, Ar, Ur, list(T_amb_list), T_sp, U_cond, T_cond, U_tank, A_tank, c_t, A_cond), show_results)
+
+# Update the persistent plots and labels with a finished simulation
+def show_results(results):
+    time_values, T_tank_values, Q_hp_total, avg_cop, cop_values = results
+
+    # update line data in place instead of building new figures
+    tank_line.set_data(time_values / 3600, T_tank_values)
+    cop_line.set_data(time_values / 3600, cop_values)
+    ax2.relim()
+    ax2.autoscale_view(scalex=False)
+    for canvas in (canvas_temperature, canvas_cop):
+        canvas.draw_idle()
+        canvas.get_tk_widget().grid(row=1, column=0, pady=10)
 
     # Display total energy consumption
     energy_label.config(text=f"Total Energy Consumption: {Q_hp_total / 3.6e6:.2f} kWh")
@@ -282,11 +267,13 @@ def reset_fields():
     city_var.set("Please Select")
     house_var.set("Please Select")
 
-    # Clear the plots in the frames
-    for frame in [frame_temperature_plot, frame_performance_metrics]:
-        for widget in frame.winfo_children():
-            if isinstance(widget, FigureCanvasTkAgg):
-                widget.get_tk_widget().destroy()
+    # Drop any pending results and clear the plots in the frames
+    worker.cancel('weather')
+    worker.cancel('simulation')
+    for line in (tank_line, cop_line):
+        line.set_data([], [])
+    for canvas in (canvas_temperature, canvas_cop):
+        canvas.get_tk_widget().grid_remove()
 
     # Reset performance metrics labels
     energy_label.config(text="Total Energy Consumption: ")
@@ -298,20 +285,6 @@ tk.Label(frame_params, text="Select City for Outside Temperature:").grid(row=len
 city_dropdown = ttk.Combobox(frame_params, textvariable=city_var, values=list(cities.keys()))
 city_dropdown.grid(row=len(parameters) + 1, column=1, pady=5, padx=5)
 
-# Function to update the temperature based on selected city
-def update_temperature_display(city_name):
-    global T_amb_list  # Global variable to hold the temperature data
-    # Fetch temperature data for the selected city
-    T_amb_list = get_temperature_for_city(city_name)
-    if T_amb_list:
-        print(f"Temperature data for {city_name} fetched successfully!")
-        # Set the first temperature value as the current outside temperature for display
-        current_temp = T_amb_list[0]  # Assuming we're showing the first value for now
-        return current_temp
-    else:
-        print(f"Failed to fetch temperature data for {city_name}.")
-        return 0
-
 # Update temperature button
 tk.Button(frame_params, text="Update Temperature", command=update_temperature).grid(row=13, column=0, columnspan=2, pady=10)
 
@@ -340,6 +313,37 @@ energy_label.grid(row=2, column=0, pady=10)
 avg_cop_label = tk.Label(frame_performance_metrics, text="Average COP: ", font=("Arial", 12, 'bold'))
 avg_cop_label.grid(row=3, column=0, pady=10)
 
+# Temperature plot: created once and embedded in tkinter, its line data is updated on every run
+fig = Figure(figsize=(5.5, 3.75))
+ax = fig.add_subplot()
+tank_line, = ax.plot([], [], label="Tank Temperature", linewidth=1.5)
+ax.axhline(y=60, color="red", linestyle="--", label="Heat Pump Off Threshold (60°C)", linewidth=1)
+ax.axhline(y=40, color="blue", linestyle="--", label="Heat Pump On Threshold (40°C)", linewidth=1)
+ax.set_xlabel("Time (hours)", fontsize=10)
+ax.set_ylabel("Tank Temperature (°C)", fontsize=10)
+ax.set_xlim(0, 24)
+ax.set_ylim(35, 70)
+ax.set_xticks(range(0, 25, 4))
+ax.tick_params(axis='both', labelsize=9)
+ax.legend(loc="upper right", fontsize=9)
+ax.grid(True)
+fig.tight_layout()
+canvas_temperature = FigureCanvasTkAgg(fig, master=frame_temperature_plot)
+
+# COP Plot
+fig2 = Figure(figsize=(5.5, 3))
+ax2 = fig2.add_subplot()
+cop_line, = ax2.plot([], [], label='COP', color='purple')
+ax2.set_xlabel('Time (hours)', fontsize=9)
+ax2.set_ylabel('COP', fontsize=9)
+ax2.set_xlim(0, 24)
+ax2.set_xticks(range(0, 25, 4))
+ax2.tick_params(axis='both', labelsize=9)
+ax2.set_title('Coefficient of Performance (COP) vs Time', fontsize=10)
+ax2.grid(True)
+fig2.tight_layout()
+canvas_cop = FigureCanvasTkAgg(fig2, master=frame_performance_metrics)
+
 # Frame for running simulation
 run_sim_button = ttk.Button(frame_params, text="Run Simulation", command=lambda: run_simulation( 
     float(Aw_entry.get()), float(Uw_entry.get()), float(Ar_entry.get()), float(Ur_entry.get()), 
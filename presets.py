@@ -0,0 +1,74 @@
+# Preset Locations and House Types
+
+# Capabilities:
+# - Defines the cities used to fetch outside temperature data.
+# - Defines the preset house types (building envelope and tank parameters).
+# - Defines the hot water usage profile of each day type (extra load during the usage peaks).
+# - Shared by the user interface, the optimisation and any batch runs.
+
+# Limitations:
+# - Only a fixed set of cities and house types is provided.
+
+import numpy as np
+from meteostat import Point
+
+# Define coordinates for additional cities
+cities = {
+    'Edinburgh': Point(55.9533, -3.1883),
+    'Oslo': Point(59.9139, 10.7522),
+    'Harbin': Point(45.8038, 126.5347),
+    'Toronto': Point(43.65107, -79.347015),
+    'Nairobi': Point(-1.286389, 36.817223),
+    'Rio de Janeiro': Point(-22.9068, -43.1729),
+    'Cape Town': Point(-33.9249, 18.4241)
+}
+
+# Preset house types with their parameters and the city each one is evaluated in
+house_types = {
+    'A': {'Aw': 85, 'Uw': 0.4, 'Ar': 80, 'Ur': 0.15, 'T_sp': 288.15,
+          'Mass of Water in Hot Water Tank in kg': 160, 
+          'Initial Tank Temperature in K': 318.15,
+          'Heat Pump On Threshold in K': 313.15, 
+          'Heat Pump Off Threshold in K': 333.15,
+          'Tank Surface Area in m² (A_tank)': 0.8, 'City': 'Harbin', 'Outside Temp': 0},
+    'B': {'Aw': 135, 'Uw': 0.6, 'Ar': 120, 'Ur': 0.25, 'T_sp': 298.15,
+          'Mass of Water in Hot Water Tank in kg': 200,
+          'Initial Tank Temperature in K': 318.15,
+          'Heat Pump On Threshold in K': 313.15, 
+          'Heat Pump Off Threshold in K': 333.15,
+          'Tank Surface Area in m² (A_tank)': 1, 'City': 'Nairobi', 'Outside Temp': 0},
+    'C': {'Aw': 180, 'Uw': 0.8, 'Ar': 160, 'Ur': 0.3, 'T_sp': 303.15,
+          'Mass of Water in Hot Water Tank in kg': 240, 
+          'Initial Tank Temperature in K': 318.15,
+          'Heat Pump On Threshold in K': 313.15, 
+          'Heat Pump Off Threshold in K': 333.15,
+          'Tank Surface Area in m² (A_tank)': 1.2, 'City': 'Rio de Janeiro', 'Outside Temp': 0},
+    'D': {'Aw': 132, 'Uw': 0.51, 'Ar': 120, 'Ur': 0.18, 'T_sp': 293.15,
+          'Mass of Water in Hot Water Tank in kg': 200, 
+          'Initial Tank Temperature in K': 318.15,
+          'Heat Pump On Threshold in K': 313.15, 
+          'Heat Pump Off Threshold in K': 333.15,
+          'Tank Surface Area in m² (A_tank)': 1, 'City': 'Edinburgh', 'Outside Temp': 0},
+}
+
+# Extra load (W) from hot water use for each day type, as (first hour, last hour, extra load) periods
+# over the hourly load list; where periods overlap the first one listed applies (holiday hour 10 gets +1500)
+hot_water_profiles = {
+    'weekday': [(7, 9, 1800), (17, 20, 1500)],  # morning and evening peaks
+    'saturday': [(9, 11, 2000), (18, 21, 1600)],
+    'holiday': [(9, 10, 1500), (10, 13, 3000), (15, 17, 1000)],
+    'before hot-water adjustment': [],  # space heating load only
+}
+day_types = list(hot_water_profiles)
+
+
+def hot_water_schedule(day_type, n_points=25):
+    # extra load at each of n_points hourly entries for the given day type, as an array
+    schedule = np.zeros(n_points)
+    assigned = np.zeros(n_points, dtype=bool)
+    hours = np.arange(n_points)
+    for first, last, extra in hot_water_profiles[day_type]:
+        period = (hours >= first) & (hours <= last) & ~assigned
+        schedule[period] = extra
+        assigned |= period
+    return schedule
@@ -0,0 +1,158 @@
+# Scenario Matrix Runner
+
+# Capabilities:
+# - Expands the full house type x city x day type x date matrix from the presets.
+# - Precomputes each day type's hot water schedule once as an array and fetches each city's weather once per date.
+# - Simulates the scenarios on a process pool (--workers) with any of the heat_system solvers.
+# - Writes per-scenario summaries and time series to one columnar .npz file that can be queried without re-simulating.
+
+# Limitations:
+# - Every scenario covers one day (midnight to midnight) of hourly weather.
+# - System constants other than the house presets (condenser, tank loss coefficient) are fixed, as in the UI.
+
+# Usage:
+#   python scenarios.py --start 2023-01-01 --days 7 --workers 4 --output scenario_results.npz
+#   results = load_results('scenario_results.npz'); rows = select(results, city='Oslo', day_type='holiday')
+
+import argparse
+import itertools
+import multiprocessing
+import os
+from datetime import datetime, timedelta
+import numpy as np
+from heat_system import Heat_system, solvers
+from presets import cities, day_types, hot_water_schedule, house_types
+from weather_store import get_temperatures
+
+# system constants shared by every scenario (the values the UI uses)
+U_cond = 300  # condenser heat transfer coefficient (W/m^2K)
+T_cond = 343.15  # condenser temperature (K)
+U_tank = 5  # tank heat transfer coefficient (W/m^2K)
+A_cond = 1.11  # condenser surface area (m^2)
+c_water = 4186  # specific heat capacity of water (J/kgK)
+
+# per-scenario summary columns, taken from Heat_system.metrics
+metric_columns = ('thermal_energy', 'electrical_energy', 'effective_cop', 'time_weighted_cop', 'compressor_starts',
+                  'duty_cycle', 'time_outside_band')
+
+
+def expand_matrix(houses, city_names, day_type_names, dates):
+    # every (house, city, day type, date) combination, in a fixed order
+    return list(itertools.product(houses, city_names, day_type_names, dates))
+
+
+def load_weather(city_names, dates):
+    # hourly temperatures (midnight to midnight, 25 values) for every city and date, fetched once each
+    weather = {}
+    for city, date in itertools.product(city_names, dates):
+        T_amb = get_temperatures(cities[city], date, date + timedelta(days=1))
+        if len(T_amb) == 25 and not np.isnan(T_amb).any():
+            weather[(city, date)] = np.array(T_amb, dtype=float)
+        else:
+            print(f"Skipping {city} on {date:%Y-%m-%d}: incomplete weather record")
+    return weather
+
+
+# per-process copy of the weather, schedules and settings, set once by init_worker
+worker_context = {}
+
+
+def init_worker(weather, schedules, cop_model, solver, time_points):
+    worker_context.update(weather=weather, schedules=schedules, solver=solver, time_points=time_points)
+    Heat_system.cop_model = cop_model
+
+
+def run_scenario(scenario):
+    # simulate one scenario; returns (summary values, tank temperatures (°C), pump states)
+    house, city, day_type, date = scenario
+    c = worker_context
+    preset = house_types[house]
+    heat_system = Heat_system(preset['Aw'], preset['Uw'], preset['Ar'], preset['Ur'], c['weather'][(city, date)], preset['T_sp'],
+                              U_cond, T_cond, U_tank, preset['Tank Surface Area in m² (A_tank)'],
+                              preset['Mass of Water in Hot Water Tank in kg'] * c_water, A_cond,
+                              hot_water_load=c['schedules'][day_type])
+    _, T_tank_values, _, _, _ = heat_system.solve_tank_temperature(preset['Initial Tank Temperature in K'],
+                                                                  time_points=c['time_points'], solver=c['solver'])
+    summary = [heat_system.metrics[name] for name in metric_columns] + [T_tank_values[-1]]
+    return summary, T_tank_values, heat_system.pump_states
+
+
+def run_scenarios(scenarios, weather, workers=1, solver='analytic', time_points=1000):
+    # simulate every scenario and gather the results as columns (one entry or row per scenario)
+    if solver not in solvers:
+        raise ValueError(f"Unknown solver '{solver}', expected one of {solvers}")
+    schedules = {day_type: hot_water_schedule(day_type) for day_type in {s[2] for s in scenarios}}
+    Heat_system.cop_model.coefficients  # fit once here rather than in every worker
+    initargs = (weather, schedules, Heat_system.cop_model, solver, time_points)
+
+    if workers > 1:
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=initargs) as pool:
+            outputs = pool.map(run_scenario, scenarios, chunksize=max(1, len(scenarios) // (4 * workers)))
+    else:
+        init_worker(*initargs)
+        outputs = [run_scenario(scenario) for scenario in scenarios]
+
+    summaries = np.array([output[0] for output in outputs], dtype=float).reshape(len(scenarios), len(metric_columns) + 1)
+    results = {
+        'house': np.array([s[0] for s in scenarios], dtype=str),
+        'city': np.array([s[1] for s in scenarios], dtype=str),
+        'day_type': np.array([s[2] for s in scenarios], dtype=str),
+        'date': np.array([f"{s[3]:%Y-%m-%d}" for s in scenarios], dtype=str),
+    }
+    for i, name in enumerate(metric_columns + ('final_tank_temp',)):
+        results[name] = summaries[:, i]
+    results['compressor_starts'] = results['compressor_starts'].astype(int)
+    results['time_values'] = np.linspace(0, 86400, time_points)
+    results['T_tank'] = np.array([output[1] for output in outputs]).reshape(len(scenarios), time_points)  # °C
+    results['pump_states'] = np.array([output[2] for output in outputs], dtype=bool).reshape(len(scenarios), time_points)
+    results['T_amb'] = np.array([weather[(s[1], s[3])] for s in scenarios]).reshape(len(scenarios), 25)  # hourly, °C
+    return results
+
+
+def save_results(path, results):
+    # write to a temporary file first so an interrupted run never leaves a truncated results file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        np.savez_compressed(file, **results)
+    os.replace(tmp_path, path)
+
+
+def load_results(path):
+    # the saved columns as a dict of arrays
+    with np.load(path) as stored:
+        return {name: stored[name] for name in stored.files}
+
+
+def select(results, **criteria):
+    # row indices of the scenarios matching every criterion, e.g. select(results, house='A', city='Oslo')
+    rows = np.ones(len(results['house']), dtype=bool)
+    for column, value in criteria.items():
+        rows &= results[column] == value
+    return np.flatnonzero(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate every house type x city x day type x date scenario")
+    parser.add_argument('--houses', nargs='+', default=list(house_types), choices=list(house_types))
+    parser.add_argument('--cities', nargs='+', default=list(cities), choices=list(cities))
+    parser.add_argument('--day-types', nargs='+', default=day_types, choices=day_types)
+    parser.add_argument('--start', default='2023-01-01', help="first date (YYYY-MM-DD)")
+    parser.add_argument('--days', type=int, default=1, help="number of consecutive dates")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument('--solver', default='analytic', choices=solvers)
+    parser.add_argument('--time-points', type=int, default=1000, help="output points per day")
+    parser.add_argument('--output', default='scenario_results.npz')
+    args = parser.parse_args()
+
+    start = datetime.fromisoformat(args.start)
+    dates = [start + timedelta(days=i) for i in range(args.days)]
+    weather = load_weather(args.cities, dates)
+    scenarios = [s for s in expand_matrix(args.houses, args.cities, args.day_types, dates) if (s[1], s[3]) in weather]
+
+    results = run_scenarios(scenarios, weather, args.workers, args.solver, args.time_points)
+    save_results(args.output, results)
+    print(f"{len(scenarios)} scenarios written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import numpy as np
+from heat_system import Heat_system
+
+# house D in a mild sinusoidal day, with the constants of scenarios.py
+T_amb_list = list(5 + 5 * np.sin(np.linspace(0, 6.28, 25)))
+house_D = (132, 0.51, 120, 0.18, T_amb_list, 293.15, 300, 343.15, 5, 1, 200 * 4186, 1.11)
+
+
+def solve(solver, **options):
+    system = Heat_system(*house_D, **options)
+    Q_hp_total = system.solve_tank_temperature(318.15, solver=solver)[2]
+    return system, Q_hp_total
+
+
+def test_single_layer_stratified_matches_analytic():
+    analytic, Q_analytic = solve('analytic')
+    stratified, Q_stratified = solve('stratified', layers=1)
+    assert len(stratified.switch_times) == len(analytic.switch_times)
+    assert np.abs(stratified.switch_times - analytic.switch_times).max() < 0.5
+    assert abs(Q_stratified / Q_analytic - 1) < 1e-5
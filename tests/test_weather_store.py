@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import textwrap
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import meteostat
+import weather_store
+from presets import cities
+
+package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeHourly:
+    # stands in for meteostat.Hourly, including its habit of writing the station altitude into the Point
+    def __init__(self, point, start, end):
+        point._alt = 57.0
+        self.start, self.end = start, end
+
+    def fetch(self):
+        index = pd.date_range(self.start, self.end, freq='h')
+        return pd.DataFrame({'temp': np.arange(len(index), dtype=float)}, index=index)
+
+
+def test_prefetched_periods_read_back_offline_in_new_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(meteostat, 'Hourly', FakeHourly)
+    store = weather_store.WeatherStore(str(tmp_path), offline=False)
+    days = [datetime(2023, 1, 1) + timedelta(days=i) for i in range(3)]
+    for day in days:
+        store.prefetch({'Oslo': cities['Oslo']}, day, day + timedelta(days=1))
+    assert cities['Oslo']._alt is None  # the shared preset Point is left untouched
+
+    script = textwrap.dedent(f"""
+        from datetime import datetime, timedelta
+        import weather_store
+        from presets import cities
+        store = weather_store.WeatherStore({str(tmp_path)!r}, offline=True)
+        for i in range(3):
+            day = datetime(2023, 1, 1) + timedelta(days=i)
+            assert len(store.get_temperatures(cities['Oslo'], day, day + timedelta(days=1))) == 25
+    """)
+    subprocess.run([sys.executable, '-c', script], cwd=package, check=True)
+
+
+def test_empty_download_is_not_cached(tmp_path, monkeypatch):
+    class EmptyHourly:
+        # what meteostat returns when the request fails
+        def __init__(self, point, start, end):
+            pass
+
+        def fetch(self):
+            return pd.DataFrame()
+    monkeypatch.setattr(meteostat, 'Hourly', EmptyHourly)
+    store = weather_store.WeatherStore(str(tmp_path), offline=False)
+    start = datetime(2023, 1, 1)
+    assert store.get_temperatures((59.9, 10.7), start, start + timedelta(days=1)) == []
+    assert os.listdir(tmp_path) == [] and store.memory == {}
@@ -0,0 +1,148 @@
+# Local Weather Cache
+
+# Capabilities:
+# - Caches Meteostat weather series on disk (one compact .npz file per request) and in memory.
+# - Serves repeat requests for the same location and period without a network round trip.
+# - Bulk-prefetches every preset city for a date range (run this file directly).
+# - Strict offline mode that only reads from the cache (for machines without internet access).
+
+# Limitations:
+# - Requests are cached exactly as asked for; overlapping date ranges are stored separately.
+# - Only numeric columns of the Meteostat data are kept.
+# - Series without any temperature reading (e.g. a failed download) are returned but never cached.
+
+import argparse
+import copy
+import os
+from datetime import datetime, timedelta
+import numpy as np
+
+# default cache folder and offline switch (can be overridden with environment variables)
+default_directory = os.environ.get('HEAT_WEATHER_CACHE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'weather_cache'))
+default_offline = os.environ.get('HEAT_WEATHER_OFFLINE', '') not in ('', '0')
+
+# Meteostat interface and temperature column for each supported resolution
+resolutions = {
+    'hourly': ('Hourly', 'temp'),
+    'daily': ('Daily', 'tavg'),
+}
+
+
+class WeatherStore:
+    def __init__(self, directory=default_directory, offline=default_offline):
+        self.directory = directory  # folder holding the cached .npz files
+        self.offline = offline  # if True, never contact Meteostat
+        self.memory = {}  # series already loaded in this process
+
+    def key(self, point, start, end, resolution='hourly'):
+        # cache key built from the location, the period and the resolution
+        if resolution not in resolutions:
+            raise ValueError(f"Unknown resolution '{resolution}', expected one of {tuple(resolutions)}")
+        lat, lon, alt = (point._lat, point._lon, point._alt) if hasattr(point, '_lat') else (tuple(point) + (None,))[:3]
+        alt = 'none' if alt is None else f"{alt:g}"
+        return f"{resolution}_{lat:.4f}_{lon:.4f}_{alt}_{start:%Y%m%d%H}_{end:%Y%m%d%H}"
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def fetch(self, point, start, end, resolution='hourly', keep_in_memory=True):
+        # return the weather series as a dict of arrays ('time' in seconds since the epoch plus data columns)
+        # keep_in_memory=False serves the request without adding it to the in-process cache
+        key = self.key(point, start, end, resolution)
+        if key in self.memory:
+            return self.memory[key]
+        if os.path.exists(self.path(key)):
+            with np.load(self.path(key)) as stored:
+                series = {name: stored[name] for name in stored.files}
+        elif self.offline:
+            raise LookupError(f"Weather for {key} is not cached and the store is offline; prefetch it first")
+        else:
+            series = self.download(point, start, end, resolution)
+            if not self.has_temperatures(series, resolution):
+                # Meteostat returns an empty frame when the request fails, so leave it uncached and retry next time
+                return series
+            self.save(key, series)
+        if keep_in_memory:
+            self.memory[key] = series
+        return series
+
+    def has_temperatures(self, series, resolution='hourly'):
+        # True if the series holds at least one temperature reading
+        column = resolutions[resolution][1]
+        return column in series and bool(np.isfinite(series[column]).any())
+
+    def download(self, point, start, end, resolution):
+        # fetch from Meteostat (imported here so offline use does not need a working meteostat setup)
+        # meteostat writes the altitude of the stations it picks back into the Point, which would change the cache key
+        # of every later request for that (shared, e.g. presets.cities) location, so it gets a copy
+        import meteostat
+        interface = getattr(meteostat, resolutions[resolution][0])
+        data = interface(copy.copy(point) if hasattr(point, '_lat') else point, start, end).fetch()
+        series = {'time': data.index.values.astype('datetime64[s]').astype(np.int64)}
+        for column in data.columns:
+            if np.issubdtype(data[column].dtype, np.number):
+                series[column] = data[column].to_numpy(dtype=float)
+        return series
+
+    def save(self, key, series):
+        # write to a temporary file first so an interrupted write never leaves a corrupt cache entry
+        # (named per process, so several processes caching the same series cannot mix their writes)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            np.savez_compressed(file, **series)
+        os.replace(tmp_path, self.path(key))
+
+    def get_temperatures(self, point, start, end, resolution='hourly', keep_in_memory=True):
+        # list of temperatures (°C), the form the simulation code expects for T_amb_list
+        series = self.fetch(point, start, end, resolution, keep_in_memory)
+        column = resolutions[resolution][1]
+        return series[column].tolist() if column in series else []
+
+    def prefetch(self, points, start, end, resolution='hourly'):
+        # make sure every location in points (a dict such as presets.cities) is cached for the period
+        fetched = 0
+        for name, point in points.items():
+            key = self.key(point, start, end, resolution)
+            if key not in self.memory and not os.path.exists(self.path(key)):
+                if not self.has_temperatures(self.fetch(point, start, end, resolution), resolution):
+                    print(f"No {resolution} weather available for {name}, nothing cached")
+                    continue
+                print(f"Cached {resolution} weather for {name}")
+                fetched += 1
+        return fetched
+
+
+# hourly temperatures for a long period, fetched (and cached) one block of days at a time
+# so the whole series never has to be held in memory; suitable as input to heat_system.simulate_stream
+def iter_temperatures(point, start, end, days_per_request=31, store=None):
+    store = store or default_store
+    block_start = start
+    while block_start <= end:
+        # Meteostat includes the end hour, so stop each block one hour before the next one starts
+        block_end = min(block_start + timedelta(days=days_per_request) - timedelta(hours=1), end)
+        yield from store.get_temperatures(point, block_start, block_end, keep_in_memory=False)
+        block_start = block_end + timedelta(hours=1)
+
+
+# shared store used by the UI and the scripts
+default_store = WeatherStore()
+
+
+def get_temperatures(point, start, end, resolution='hourly'):
+    return default_store.get_temperatures(point, start, end, resolution)
+
+
+if __name__ == "__main__":
+    from presets import cities
+
+    parser = argparse.ArgumentParser(description="Prefetch weather for every preset city into the local cache")
+    parser.add_argument('--start', default='2023-01-01', help="start date (YYYY-MM-DD)")
+    parser.add_argument('--end', default='2023-01-02', help="end date (YYYY-MM-DD)")
+    parser.add_argument('--resolution', default='hourly', choices=list(resolutions))
+    parser.add_argument('--directory', default=default_directory, help="cache folder")
+    args = parser.parse_args()
+
+    store = WeatherStore(args.directory, offline=False)
+    count = store.prefetch(cities, datetime.fromisoformat(args.start), datetime.fromisoformat(args.end), args.resolution)
+    print(f"{count} new series cached in {args.directory}")
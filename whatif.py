@@ -0,0 +1,275 @@
+# Headless What-If Service
+
+# Capabilities:
+# - Runs heat system simulations from JSON parameter sets, one at a time or in batches, without the UI.
+# - Parameters default to a preset house type; weather is given directly or fetched for a preset city and date.
+# - Returns the performance metrics and the tank temperature, COP and pump state series downsampled to a few points.
+# - Answers repeat queries from an LRU cache bounded by memory, keyed on a hash of the parameters and weather series.
+# - Available as a command line tool and as a local HTTP server that can run several worker processes.
+
+# Limitations:
+# - Each worker process has its own cache.
+# - Several server worker processes need a platform with fork (Linux, macOS).
+# - Parameter sets are checked for numbers with physical ranges (positive areas, U-values, heat capacity and set point,
+#   a condenser above the pump off threshold, a tank starting as liquid water), nothing more;
+#   a parameter set that fails is answered with an error and never cached.
+
+# Usage:
+#   python whatif.py run request.json        (or - to read the request from standard input)
+#   python whatif.py serve --port 8050 --workers 4
+#   curl -X POST localhost:8050/simulate -d '[{"house": "A", "city": "Oslo"}, {"house": "A", "city": "Oslo", "T_sp": 291.15}]'
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import numpy as np
+from heat_system import T_pump_off, T_pump_on, Heat_system, run_heat_system_simulation, solvers
+from presets import cities, house_types
+from weather_store import get_temperatures
+
+# system values used when a request does not give them (the UI's defaults, with house D's envelope and tank)
+defaults = {'house': 'D', 'U_cond': 300, 'T_cond': 343.15, 'U_tank': 5, 'A_cond': 1.11, 'solver': 'analytic',
+            'date': '2023-01-01', 'points': 97}
+simulation_params = ('Aw', 'Uw', 'Ar', 'Ur', 'T_sp', 'U_cond', 'T_cond', 'U_tank', 'A_tank', 'c_t', 'A_cond', 'initial_tank_temp')
+request_keys = set(simulation_params) | {'house', 'city', 'date', 'T_amb_list', 'solver', 'points'}
+# parameters that must be positive for the model to be physical (heat capacity, areas, U-values, set point in K)
+positive_params = ('Aw', 'Uw', 'Ar', 'Ur', 'U_cond', 'U_tank', 'A_tank', 'c_t', 'A_cond', 'T_sp')
+# the tank must start as liquid water (K)
+initial_tank_temp_range = (273.15, 373.15)
+
+
+def resolve(request):
+    # full parameter set for a request: explicit values, then the house preset, then the defaults
+    unknown = set(request) - request_keys
+    if unknown:
+        raise ValueError(f"Unknown parameters {sorted(unknown)}")
+    settings = dict(defaults)
+    settings.update(request)
+    if settings['house'] not in house_types:
+        raise ValueError(f"Unknown house '{settings['house']}', expected one of {list(house_types)}")
+    preset = house_types[settings['house']]
+    from_preset = {'Aw': preset['Aw'], 'Uw': preset['Uw'], 'Ar': preset['Ar'], 'Ur': preset['Ur'], 'T_sp': preset['T_sp'],
+                   'A_tank': preset['Tank Surface Area in m² (A_tank)'], 'c_t': preset['Mass of Water in Hot Water Tank in kg'] * 4186,
+                   'initial_tank_temp': preset['Initial Tank Temperature in K']}
+    given = {name: settings[name] if name in settings else from_preset[name] for name in simulation_params}
+    not_numbers = [name for name, value in given.items() if isinstance(value, bool) or not isinstance(value, (int, float))]
+    if not_numbers:
+        raise ValueError(f"Parameters {not_numbers} must be numbers")
+    params = {name: float(value) for name, value in given.items()}
+    not_finite = [name for name, value in params.items() if not np.isfinite(value)]
+    if not_finite:
+        raise ValueError(f"Parameters {not_finite} must be finite")
+    not_positive = [name for name in positive_params if params[name] <= 0]
+    if not_positive:
+        raise ValueError(f"Parameters {not_positive} must be positive")
+    if params['T_cond'] <= T_pump_off:
+        raise ValueError(f"T_cond must be above the pump off threshold ({T_pump_off} K), or the pump never switches off")
+    low, high = initial_tank_temp_range
+    if not low < params['initial_tank_temp'] < high:
+        raise ValueError(f"initial_tank_temp must be between {low} and {high} K (the pump band is {T_pump_on}-{T_pump_off} K)")
+    if settings['solver'] not in solvers:
+        raise ValueError(f"Unknown solver '{settings['solver']}', expected one of {solvers}")
+
+    if 'T_amb_list' in settings:
+        T_amb_list = [float(T) for T in settings['T_amb_list']]
+    else:
+        city = settings.get('city', preset['City'])
+        if city not in cities:
+            raise ValueError(f"Unknown city '{city}', expected one of {list(cities)}")
+        start = datetime.fromisoformat(settings['date'])
+        T_amb_list = get_temperatures(cities[city], start, start + timedelta(days=1))
+    if len(T_amb_list) < 2:
+        raise ValueError("Weather series needs at least two hourly values")
+    if not np.isfinite(T_amb_list).all():
+        raise ValueError("Weather series has missing or non-finite values")
+    return params, T_amb_list, settings['solver'], int(settings['points'])
+
+
+def cache_key(params, T_amb_list, solver, points):
+    # canonical hash: sorted parameter names with exact float representations, then the weather series
+    canonical = json.dumps({'params': sorted((name, repr(value)) for name, value in params.items()),
+                            'weather': [repr(float(T)) for T in T_amb_list], 'solver': solver, 'points': points})
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def downsample(values, points):
+    # evenly spaced samples of a series, always keeping the first and last value
+    values = np.asarray(values)
+    if points >= len(values):
+        return values
+    return values[np.linspace(0, len(values) - 1, max(points, 2)).round().astype(int)]
+
+
+def simulate(params, T_amb_list, solver, points):
+    time_values, T_tank_values, Q_hp_total, avg_cop, cop_values, info = run_heat_system_simulation(
+        params['Aw'], params['Uw'], params['Ar'], params['Ur'], T_amb_list, params['T_sp'], params['U_cond'], params['T_cond'],
+        params['U_tank'], params['A_tank'], params['c_t'], params['A_cond'], params['initial_tank_temp'],
+        solver=solver, full_output=True)
+    return {
+        'params': params,
+        'solver': solver,
+        'Q_hp_total': float(Q_hp_total),
+        'avg_cop': float(avg_cop),
+        'metrics': {name: float(value) for name, value in info['metrics'].items()},
+        'series': {
+            'time_hours': (downsample(time_values, points) / 3600).tolist(),
+            'T_tank': downsample(T_tank_values, points).tolist(),  # °C
+            'cop': downsample(cop_values, points).tolist(),
+            'pump_on': downsample(info['pump_states'], points).tolist(),
+        },
+    }
+
+
+# least recently used cache of responses, bounded by the total size of the stored responses
+class ResponseCache:
+    def __init__(self, max_bytes=64 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (response, size in bytes)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key][0]
+
+    def put(self, key, response):
+        size = len(json.dumps(response))  # the JSON size is a close, cheap measure of the memory held
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (response, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.size -= self.entries.popitem(last=False)[1][1]
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+cache = ResponseCache()
+
+
+def handle(request):
+    # answer one parameter set (a dict) or a batch (a list of dicts); errors are reported per parameter set
+    if isinstance(request, list):
+        return [handle(item) for item in request]
+    if not isinstance(request, dict):
+        return {'error': "Each parameter set must be a JSON object"}
+    try:
+        params, T_amb_list, solver, points = resolve(request)
+    except (ValueError, TypeError, LookupError) as error:
+        return {'error': str(error)}
+    except Exception as error:  # e.g. a failed weather download
+        return {'error': f"{type(error).__name__}: {error}"}
+    key = cache_key(params, T_amb_list, solver, points)
+    response = cache.get(key)
+    if response is None:
+        try:
+            response = simulate(params, T_amb_list, solver, points)
+        except Exception as error:  # one failing parameter set must not take down the rest of the batch
+            return {'error': f"{type(error).__name__}: {error}"}
+        cache.put(key, response)
+        return dict(response, key=key, cached=False)
+    return dict(response, key=key, cached=True)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok', 'cache': cache.stats()})
+        else:
+            self.send_json(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/simulate':
+            self.send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError as error:
+            self.send_json(400, {'error': f"Invalid JSON: {error}"})
+            return
+        try:
+            response = handle(request)
+        except Exception as error:
+            self.send_json(500, {'error': f"{type(error).__name__}: {error}"})
+            return
+        self.send_json(200, response)
+
+    def log_message(self, format, *args):
+        pass  # keep the console quiet; failures are reported in the responses
+
+
+def serve(host='127.0.0.1', port=8050, workers=1):
+    # several workers share one listening socket (pre-fork), each with its own cache
+    Heat_system.cop_model.coefficients  # fit the COP model once before forking
+    server = HTTPServer((host, port), RequestHandler)
+    print(f"Serving what-if simulations on http://{host}:{port}/simulate with {workers} worker(s)")
+    processes = []
+    if workers > 1:
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=server.serve_forever, daemon=True) for _ in range(workers - 1)]
+        for process in processes:
+            process.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless heat system what-if simulations")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="simulate the parameter set(s) in a JSON file and print the results")
+    run.add_argument('request', help="JSON file with one parameter set or a list of them (- for standard input)")
+    server = commands.add_parser('serve', help="serve simulations over HTTP (POST /simulate, GET /health)")
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=8050)
+    server.add_argument('--workers', type=int, default=1, help="number of server processes")
+    server.add_argument('--cache-mb', type=float, default=64, help="response cache size per process (MB)")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if args.request == '-':
+            request = json.load(sys.stdin)
+        else:
+            with open(args.request) as file:
+                request = json.load(file)
+        json.dump(handle(request), sys.stdout, indent=2)
+        print()
+    else:
+        cache.max_bytes = int(args.cache_mb * 2 ** 20)
+        serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()